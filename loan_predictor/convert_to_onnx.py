@@ -0,0 +1,31 @@
+"""Export the pipeline's classifier to model.onnx for ONNX Runtime.
+
+Run it from this directory after retraining: python convert_to_onnx.py
+
+Only the final classifier is converted. The API encodes requests itself (see
+encoding.py), so the ONNX model takes the encoded float32 rows. Needs skl2onnx,
+which is not required to serve. ONNX Runtime keeps tree thresholds as float32,
+so a value lying exactly between a float64 threshold and its float32 rounding
+can go down a different branch than in scikit-learn.
+"""
+import hashlib
+
+import joblib
+from skl2onnx import convert_sklearn
+from skl2onnx.common.data_types import FloatTensorType
+
+with open("model.joblib", "rb") as f:
+    model_sha256 = hashlib.sha256(f.read()).hexdigest()
+model = joblib.load("model.joblib")
+classifier = model.steps[-1][1] if hasattr(model, "steps") else model
+
+onx = convert_sklearn(
+    classifier,
+    initial_types=[("input", FloatTensorType([None, classifier.n_features_in_]))],
+    options={id(classifier): {"zipmap": False}},
+)
+# The API only uses model.onnx if this still matches model.joblib.
+onx.metadata_props.add(key="model_joblib_sha256", value=model_sha256)
+with open("model.onnx", "wb") as f:
+    f.write(onx.SerializeToString())
+print(f"Wrote model.onnx ({type(classifier).__name__}, {classifier.n_features_in_} features)")
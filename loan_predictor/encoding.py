@@ -0,0 +1,94 @@
+"""Lookup-table encoding for the pipeline's fitted ColumnTransformer.
+
+Running the ColumnTransformer means a pandas round trip for every batch. Its
+two steps, standard scaling and one-hot encoding, reduce to an affine map and
+a dict lookup per column. RowEncoder applies them directly to a row of raw
+values and writes the result into a float buffer, using the column layout the
+transformer would produce.
+"""
+from sklearn.compose import ColumnTransformer
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+
+class RowEncoder:
+    """Writes raw rows into float buffers, laid out like the transformer output."""
+
+    def __init__(self, n_features, numeric, categorical):
+        self.n_features = n_features
+        # (input index, output index, mean, scale)
+        self.numeric = numeric
+        # (input index, {category: output index}); categories missing from the
+        # table (dropped or unknown) leave their whole block at zero.
+        self.categorical = categorical
+
+    def encode(self, row, out):
+        """Encode one row of raw values, in input column order, into out."""
+        out.fill(0.0)
+        for src, dst, mean, scale in self.numeric:
+            out[dst] = (row[src] - mean) / scale
+        for src, table in self.categorical:
+            dst = table.get(row[src])
+            if dst is not None:
+                out[dst] = 1.0
+
+
+def compile_encoder(transforms, feature_names):
+    """Build a RowEncoder equivalent to the fitted transforms.
+
+    Returns None when the transforms are anything other than a single,
+    unweighted ColumnTransformer made of StandardScaler, OneHotEncoder
+    (ignoring unknown categories), "drop" and "passthrough" parts. Callers
+    should then run the transforms themselves.
+    """
+    if len(transforms) != 1 or not isinstance(transforms[0], ColumnTransformer):
+        return None
+    preprocessor = transforms[0]
+    if preprocessor.transformer_weights:
+        return None
+    feature_names = list(feature_names)
+
+    numeric = []
+    categorical = []
+    for name, transformer, columns in preprocessor.transformers_:
+        if transformer == "drop":
+            continue
+        try:
+            sources = [feature_names.index(column) for column in columns]
+        except (TypeError, ValueError):
+            return None
+        start = preprocessor.output_indices_[name].start
+
+        if transformer == "passthrough":
+            numeric += [(src, start + i, 0.0, 1.0) for i, src in enumerate(sources)]
+        elif isinstance(transformer, StandardScaler):
+            mean = transformer.mean_ if transformer.with_mean else None
+            scale = transformer.scale_ if transformer.with_std else None
+            numeric += [
+                (src, start + i,
+                 0.0 if mean is None else float(mean[i]),
+                 1.0 if scale is None else float(scale[i]))
+                for i, src in enumerate(sources)
+            ]
+        elif isinstance(transformer, OneHotEncoder):
+            if getattr(transformer, "_infrequent_enabled", False):
+                return None
+            # Anything else raises on an unknown category, where the tables
+            # would silently encode it as all zeros.
+            if transformer.handle_unknown not in ("ignore", "infrequent_if_exist"):
+                return None
+            drop_idx = transformer.drop_idx_
+            dst = start
+            for i, src in enumerate(sources):
+                dropped = None if drop_idx is None else drop_idx[i]
+                table = {}
+                for j, category in enumerate(transformer.categories_[i]):
+                    if j != dropped:
+                        table[category] = dst
+                        dst += 1
+                categorical.append((src, table))
+        else:
+            return None
+
+    n_features = sum(s.stop - s.start for s in preprocessor.output_indices_.values())
+    return RowEncoder(n_features, numeric, categorical)
+
@@ -0,0 +1,287 @@
+"""Fast scoring for fitted scikit-learn random forests.
+
+The trees of the forest are packed into flat arrays once, and a Numba kernel
+walks them directly. This skips the per-call input validation and Cython
+dispatch that sklearn goes through for every tree. Numba is optional: when it
+is not installed, HAVE_NUMBA is False and trees_proba is the fallback. It
+still uses sklearn's trees but skips the estimator's input checks and the
+float64 to float32 copy.
+
+specialize_forest goes one step further. It generates Python source that
+hard-codes every tree as nested ifs, so Numba compiles the thresholds and
+feature indices in as constants.
+"""
+import hashlib
+import importlib.util
+import logging
+import os
+import shutil
+from typing import NamedTuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+
+class FlatForest(NamedTuple):
+    feature: np.ndarray
+    threshold: np.ndarray
+    left: np.ndarray
+    right: np.ndarray
+    missing_left: np.ndarray
+    value: np.ndarray
+    roots: np.ndarray
+
+
+def flatten_forest(forest):
+    """Pack the trees of a fitted forest classifier into a FlatForest.
+
+    Child indices are shifted to point into the packed arrays (leaves keep -1)
+    and leaf values are normalized to class probabilities, the same way
+    DecisionTreeClassifier.predict_proba does.
+    """
+    trees = [estimator.tree_ for estimator in forest.estimators_]
+    sizes = np.array([tree.node_count for tree in trees], dtype=np.intp)
+    roots = np.zeros(len(trees), dtype=np.intp)
+    roots[1:] = np.cumsum(sizes)[:-1]
+
+    def children(attr):
+        return np.concatenate([
+            np.where(getattr(tree, attr) == -1, -1, getattr(tree, attr) + root)
+            for tree, root in zip(trees, roots)
+        ]).astype(np.intp)
+
+    value = np.concatenate([tree.value[:, 0, :] for tree in trees])
+    normalizer = value.sum(axis=1, keepdims=True)
+    normalizer[normalizer == 0.0] = 1.0
+
+    return FlatForest(
+        feature=np.concatenate([tree.feature for tree in trees]).astype(np.intp),
+        threshold=np.concatenate([tree.threshold for tree in trees]),
+        left=children("children_left"),
+        right=children("children_right"),
+        missing_left=np.concatenate([
+            getattr(tree, "missing_go_to_left", np.zeros(tree.node_count, dtype=np.uint8))
+            for tree in trees
+        ]).astype(np.uint8),
+        value=np.ascontiguousarray(value / normalizer),
+        roots=roots,
+    )
+
+
+def map_forest(forest):
+    """Return the FlatForest with its arrays memory-mapped from .npy files.
+
+    The files live in __pycache__/flat_<digest>/, keyed by the arrays' content,
+    and are written the first time a worker sees the model. Every worker then
+    maps the same read-only pages instead of holding its own copy. Directories
+    left by earlier models are removed. This is only a memory saving: if the
+    files can't be written (e.g. a read-only app directory), the in-memory
+    forest is returned unchanged.
+    """
+    digest = hashlib.sha256()
+    for array in forest:
+        digest.update(np.ascontiguousarray(array).tobytes())
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "__pycache__")
+    current = f"flat_{digest.hexdigest()[:16]}"
+    directory = os.path.join(cache_dir, current)
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+        arrays = {}
+        for name, array in forest._asdict().items():
+            path = os.path.join(directory, name + ".npy")
+            if not os.path.exists(path):
+                tmp = f"{path}.{os.getpid()}.tmp"
+                with open(tmp, "wb") as f:
+                    np.save(f, np.ascontiguousarray(array))
+                os.replace(tmp, path)
+            # asarray drops the np.memmap subclass (Numba wants plain
+            # ndarrays); the data stays mapped.
+            arrays[name] = np.asarray(np.load(path, mmap_mode="r"))
+    except OSError as exc:
+        logger.warning("Not memory-mapping the forest arrays: %s", exc)
+        return forest
+
+    # Workers still running an older model keep their mappings alive even
+    # after the files are unlinked.
+    for entry in os.listdir(cache_dir):
+        if entry.startswith("flat_") and entry != current:
+            shutil.rmtree(os.path.join(cache_dir, entry), ignore_errors=True)
+    return FlatForest(**arrays)
+
+
+def _forest_proba(X, feature, threshold, left, right, missing_left, value, roots, out):
+    n_trees = roots.shape[0]
+    n_classes = value.shape[1]
+    for i in range(X.shape[0]):
+        for k in range(n_classes):
+            out[i, k] = 0.0
+        for t in range(n_trees):
+            node = roots[t]
+            while left[node] != -1:
+                x = X[i, feature[node]]
+                # Same routing as sklearn's Tree.apply, including NaNs.
+                if np.isnan(x):
+                    node = left[node] if missing_left[node] else right[node]
+                elif x <= threshold[node]:
+                    node = left[node]
+                else:
+                    node = right[node]
+            for k in range(n_classes):
+                out[i, k] += value[node, k]
+        for k in range(n_classes):
+            out[i, k] /= n_trees
+
+
+if HAVE_NUMBA:
+    # No fastmath: it would let LLVM assume away the NaN check above. nogil
+    # lets concurrent requests score on separate cores.
+    _forest_proba = njit(cache=True, nogil=True)(_forest_proba)
+
+
+def trees_proba(X, forest):
+    """Return class probabilities for the float32 rows of X using sklearn's trees.
+
+    This is RandomForestClassifier.predict_proba without the input validation:
+    each Tree.predict is called directly, and the leaf values are normalized
+    the same way DecisionTreeClassifier.predict_proba does.
+    """
+    n_classes = forest.n_classes_
+    out = np.zeros((X.shape[0], n_classes))
+    for estimator in forest.estimators_:
+        proba = estimator.tree_.predict(X)[:, :n_classes]
+        normalizer = proba.sum(axis=1, keepdims=True)
+        normalizer[normalizer == 0.0] = 1.0
+        out += proba / normalizer
+    out /= len(forest.estimators_)
+    return out
+
+
+def forest_proba(X, forest):
+    """Return class probabilities for the float32 rows of X."""
+    out = np.empty((X.shape[0], forest.value.shape[1]))
+    _forest_proba(X, *forest, out)
+    return out
+
+
+# Bump when the generated code changes, so stale modules are not reused.
+_CODEGEN_VERSION = b"1"
+# Python allows at most 100 levels of indentation.
+_MAX_CODEGEN_DEPTH = 90
+
+
+def _tree_source(forest, t):
+    """Return the source of a function mapping a row to its leaf in tree t.
+
+    Returns None if the tree is too deeply nested to write out.
+    """
+    lines = [f"def tree_{t}(x):"]
+
+    def emit(node, depth):
+        if depth > _MAX_CODEGEN_DEPTH:
+            return False
+        indent = "    " * depth
+        if forest.left[node] == -1:
+            lines.append(f"{indent}return {node}")
+            return True
+        feature = forest.feature[node]
+        threshold = float(forest.threshold[node])
+        # NaN fails every comparison, so "not x > t" sends it left and
+        # "x <= t" sends it right, as missing_go_to_left says.
+        if forest.missing_left[node]:
+            lines.append(f"{indent}if not x[{feature}] > {threshold!r}:")
+        else:
+            lines.append(f"{indent}if x[{feature}] <= {threshold!r}:")
+        # The left branch always returns, so the right one needs no else.
+        return emit(forest.left[node], depth + 1) and emit(forest.right[node], depth)
+
+    if not emit(forest.roots[t], 1):
+        return None
+    return "\n".join(lines)
+
+
+def _forest_source(forest):
+    trees = [_tree_source(forest, t) for t in range(len(forest.roots))]
+    if any(tree is None for tree in trees):
+        return None
+    n_trees = len(trees)
+    functions = "\n\n\n".join(f"@jit\n{tree}" for tree in trees)
+    score = "\n".join(
+        f"        _accumulate(out, i, value, tree_{t}(x))" for t in range(n_trees)
+    )
+    return f"""from numba import njit
+
+jit = njit(cache=True, nogil=True)
+
+
+@jit
+def _accumulate(out, i, value, leaf):
+    for k in range(value.shape[1]):
+        out[i, k] += value[leaf, k]
+
+
+{functions}
+
+
+@jit
+def score(X, value, out):
+    for i in range(X.shape[0]):
+        x = X[i]
+        for k in range(value.shape[1]):
+            out[i, k] = 0.0
+{score}
+        for k in range(value.shape[1]):
+            out[i, k] /= {n_trees}
+"""
+
+
+def specialize_forest(forest):
+    """Return a forest_proba-like function specialized to this FlatForest.
+
+    The generated module is written to __pycache__/forest_<digest>.py, keyed
+    by the tree arrays. Workers started from the same model therefore import
+    the same file and share Numba's on-disk compilation cache. Requires
+    Numba. Returns None if a tree is too deep to write out as nested ifs, or
+    if the module can't be written (e.g. a read-only app directory).
+    """
+    digest = hashlib.sha256(_CODEGEN_VERSION)
+    for array in forest:
+        digest.update(np.ascontiguousarray(array).tobytes())
+    name = f"forest_{digest.hexdigest()[:16]}"
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "__pycache__", name + ".py")
+
+    if not os.path.exists(path):
+        source = _forest_source(forest)
+        if source is None:
+            return None
+        # Several workers may get here at once; each writes its own file and
+        # the rename makes whichever finishes last the one that stays.
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, "w") as f:
+                f.write(source)
+            os.replace(tmp, path)
+        except OSError as exc:
+            logger.warning("Not writing the specialized forest module: %s", exc)
+            return None
+
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    score = module.score
+    value = forest.value
+
+    def specialized_proba(X):
+        out = np.empty((X.shape[0], value.shape[1]))
+        score(X, value, out)
+        return out
+
+    return specialized_proba
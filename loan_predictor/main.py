@@ -1,10 +1,25 @@
 # Part 1: Import all the tools we need
+import asyncio
+import hashlib
+import logging
+import mmap
+import os
+from collections import OrderedDict, deque
 import joblib
-import pandas as pd
-from fastapi import FastAPI
-from pydantic import BaseModel, Field
+import numpy as np
+import orjson
+from anyio import CapacityLimiter, to_thread
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict, Field
 from enum import Enum
 from fastapi.middleware.cors import CORSMiddleware # Import the CORS middleware
+from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+from encoding import compile_encoder
+from forest import HAVE_NUMBA, flatten_forest, forest_proba, map_forest, specialize_forest, trees_proba
+from onnx_model import HAVE_ONNXRUNTIME, OnnxClassifier
+
+logger = logging.getLogger(__name__)
 
 # --- Enums for categorical features ---
 class GenderEnum(str, Enum):
@@ -29,7 +44,7 @@ class PropertyAreaEnum(str, Enum):
     semiurban = 'Semiurban'
 
 # Part 2: Create our FastAPI app
-app = FastAPI(title="Loan Prediction API")
+app = FastAPI(title="Loan Prediction API", default_response_class=ORJSONResponse)
 
 # --- THIS IS THE UPDATED PART ---
 # Add the URL of your new Netlify frontend to this list
@@ -45,11 +60,280 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"], # Allows all methods (GET, POST, etc.)
     allow_headers=["*"], # Allows all headers
+    max_age=600, # Lets browsers reuse a preflight for 10 minutes
 )
 # -----------------------------------------
 
 # Part 3: Load the model
-model = joblib.load("model.joblib")
+# model.joblib is saved uncompressed, so its numpy arrays can be memory-mapped
+# read-only instead of copied into each worker's heap: every worker then reads
+# the same page-cache pages. Readahead is requested up front so the load itself
+# doesn't fault the file in page by page.
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(MODEL_DIR, "model.joblib")
+ONNX_PATH = os.path.join(MODEL_DIR, "model.onnx")
+
+if hasattr(mmap, "MADV_WILLNEED"):
+    with open(MODEL_PATH, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        m.madvise(mmap.MADV_WILLNEED)
+model = joblib.load(MODEL_PATH, mmap_mode="r")
+
+FEATURES = tuple(getattr(model, "feature_names_in_", (
+    "Gender", "Married", "Dependents", "Education", "Self_Employed",
+    "ApplicantIncome", "CoapplicantIncome", "LoanAmount", "Loan_Amount_Term",
+    "Credit_History", "Property_Area",
+)))
+MAX_BATCH = 64
+
+# Split the pipeline into its transforms and the final classifier. Samplers
+# such as SMOTE only act during fit, so they are skipped.
+*_steps, (_, classifier) = getattr(model, "steps", [("classifier", model)])
+# Requests already run on several threads at once; a classifier that also
+# fans out over its own pool would oversubscribe the CPUs.
+if hasattr(classifier, "n_jobs"):
+    classifier.n_jobs = 1
+# classes_ is read on every request; keep it off the mapped file so that
+# touching model.joblib can never change labels under a running worker.
+classifier.classes_ = np.array(classifier.classes_)
+_transforms = [
+    step for _, step in _steps
+    if step not in (None, "passthrough") and not hasattr(step, "fit_resample")
+]
+# Width of an encoded row: the classifier's input, after the transforms.
+N_ENCODED = classifier.n_features_in_
+
+# The fitted ColumnTransformer is replaced by lookup tables (see encoding.py),
+# so each request encodes its own row and batches are plain float arrays that
+# go straight to the classifier. pandas is never touched on that path.
+#
+# If the preprocessing can't be expressed that way, batches hold raw values in
+# an object buffer instead. A model fitted on named columns then gets a
+# DataFrame view over each batch size, built once here: writing into the
+# buffer updates the frames in place.
+_encoder = compile_encoder(_transforms, FEATURES)
+if _encoder is not None and _encoder.n_features != N_ENCODED:
+    logger.warning("The compiled encoder's width does not match the classifier's input; "
+                   "encoding through the preprocessor instead")
+    _encoder = None
+if _encoder is not None:
+    _batch_buf = np.empty((MAX_BATCH, N_ENCODED), dtype=np.float32)
+    _batch_inputs = None
+else:
+    _batch_buf = np.empty((MAX_BATCH, len(FEATURES)), dtype=object)
+    if hasattr(model, "feature_names_in_"):
+        import pandas as pd
+        _batch_inputs = [None] + [
+            pd.DataFrame(_batch_buf[:n], columns=FEATURES, dtype=object, copy=False)
+            for n in range(1, MAX_BATCH + 1)
+        ]
+    else:
+        _batch_inputs = [_batch_buf[:n] for n in range(MAX_BATCH + 1)]
+
+# If convert_to_onnx.py has produced model.onnx and onnxruntime is installed,
+# ONNX Runtime scores the encoded rows, whatever kind of classifier it is. The
+# export records model.joblib's sha256; a file exported from any other model is
+# ignored so a retrain never silently serves the old one.
+_onnx = None
+if HAVE_ONNXRUNTIME and os.path.exists(ONNX_PATH):
+    _onnx = OnnxClassifier(ONNX_PATH)
+    with open(MODEL_PATH, "rb") as f:
+        _model_sha256 = hashlib.sha256(f.read()).hexdigest()
+    if _onnx.source_sha256 != _model_sha256:
+        logger.warning("Ignoring model.onnx: it was not exported from this model.joblib; "
+                       "rerun convert_to_onnx.py")
+        _onnx = None
+
+# Otherwise, random forests are scored by the compiled kernel in forest.py
+# when Numba is installed (it is compiled by warm_up below). Without Numba, the
+# trees are still called directly on the float32 rows, which skips
+# predict_proba's validation and its float32 copy of X.
+_forest = None
+_fast_forest = isinstance(classifier, (RandomForestClassifier, ExtraTreesClassifier)) \
+    and classifier.n_outputs_ == 1
+if _onnx is None and _fast_forest and HAVE_NUMBA:
+    # sklearn copies tree nodes into private memory on load, so the flattened
+    # arrays are what workers should share: map_forest keeps them in .npy files
+    # and memory-maps them.
+    _forest = map_forest(flatten_forest(classifier))
+
+# With LOAN_PREDICTOR_CODEGEN=1, the forest is also written out as nested ifs
+# and compiled with its thresholds as constants (see specialize_forest). That
+# compile is slow for deep trees, so it is opt-in; the result is cached on
+# disk and shared by all workers.
+_specialized = None
+if _forest is not None and os.environ.get("LOAN_PREDICTOR_CODEGEN") == "1":
+    _specialized = specialize_forest(_forest)
+    if _specialized is None:
+        logger.warning("LOAN_PREDICTOR_CODEGEN is set, but the forest could not be "
+                       "written out as code; using the flat forest kernel")
+
+# Encoded single rows (/predict, /predict_raw) come from a free list rather
+# than being allocated per request. deque.append and deque.pop are atomic, so
+# the pool can be shared by the event loop and worker threads without a lock.
+# Without an encoder only /predict_raw uses it, so it starts empty and fills
+# up as rows are released.
+ROW_POOL_SIZE = 1024
+
+_row_pool = deque(
+    np.empty((1, N_ENCODED), dtype=np.float32)
+    for _ in range(ROW_POOL_SIZE if _encoder is not None else 0)
+)
+
+def _take_row():
+    try:
+        return _row_pool.pop()
+    except IndexError:
+        return np.empty((1, N_ENCODED), dtype=np.float32)
+
+def _release_rows(rows):
+    for row in rows:
+        if len(_row_pool) < ROW_POOL_SIZE:
+            _row_pool.append(row)
+
+def _make_row(values):
+    """Turn raw values in FEATURES order into a (1, n) row for the batch buffer.
+
+    Encoded rows are pooled; the batcher releases them once they are copied
+    into the batch buffer.
+    """
+    if _encoder is None:
+        return np.array([values], dtype=object)
+    row = _take_row()
+    _encoder.encode(values, row[0])
+    return row
+
+def _score_batch(n):
+    """Score the first n rows of the batch buffer (runs in a worker thread).
+
+    Returns the labels and the positive-class probabilities as Python lists.
+    Converting whole columns at once avoids boxing a numpy scalar per request
+    on the event loop.
+    """
+    if _encoder is not None:
+        predictions, probabilities = _score_encoded(_batch_buf[:n])
+    else:
+        predictions, probabilities = _score_inputs(_batch_inputs[n])
+    return predictions.tolist(), probabilities[:, 1].tolist()
+
+def _score_rows(rows):
+    """Score a list of raw value tuples, in FEATURES order, in one call."""
+    if _encoder is not None:
+        X = np.empty((len(rows), N_ENCODED), dtype=np.float32)
+        for values, out in zip(rows, X):
+            _encoder.encode(values, out)
+        return _score_encoded(X)
+
+    X = np.array(rows, dtype=object).reshape(len(rows), len(FEATURES))
+    if hasattr(model, "feature_names_in_"):
+        X = pd.DataFrame(X, columns=FEATURES, dtype=object, copy=False)
+    return _score_inputs(X)
+
+def _score_inputs(X):
+    """Score raw values (object array or DataFrame) through the whole pipeline."""
+    if _onnx is None and not _fast_forest:
+        return model.predict(X), model.predict_proba(X)
+    for step in _transforms:
+        X = step.transform(X)
+    if hasattr(X, "toarray"):
+        X = X.toarray()
+    return _score_encoded(X)
+
+def _score_encoded(X):
+    """Score rows that are already in the classifier's input layout."""
+    if _onnx is None and not _fast_forest:
+        return classifier.predict(X), classifier.predict_proba(X)
+    # ONNX Runtime and sklearn's trees take float32 features. Encoded rows
+    # already are float32, so this only copies the pipeline transforms' output.
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    if _onnx is not None:
+        return _onnx.predict(X)
+    if _specialized is not None:
+        probabilities = _specialized(X)
+    elif _forest is not None:
+        probabilities = forest_proba(X, _forest)
+    else:
+        probabilities = trees_proba(X, classifier)
+    return _with_labels(probabilities)
+
+def _with_labels(probabilities):
+    """Pair forest class probabilities with the predicted labels.
+
+    For sklearn's forests, predict() is argmax over predict_proba() (ties going
+    to the first class), so deriving the label here saves a second pass over
+    the trees. Other classifiers keep their own predict().
+    """
+    return classifier.classes_.take(probabilities.argmax(axis=1)), probabilities
+
+async def _run_batcher(queue, limiter):
+    """Score queued requests together, up to MAX_BATCH at a time.
+
+    An idle batcher dispatches a request as soon as it arrives. Requests that
+    come in while a batch is being scored wait in the queue and make up the
+    next batch, so batches only grow when there is load to batch.
+
+    Batches run on their own limiter, so /predict never waits for a thread
+    behind long /predict_batch or /predict_raw calls.
+    """
+    while True:
+        items = [await queue.get()]
+        while len(items) < MAX_BATCH and not queue.empty():
+            items.append(queue.get_nowait())
+
+        n = len(items)
+        rows = [row for row, _ in items]
+        try:
+            np.concatenate(rows, axis=0, out=_batch_buf[:n])
+            if _encoder is not None:
+                _release_rows(rows)
+            labels, confidences = await to_thread.run_sync(_score_batch, n, limiter=limiter)
+        except Exception as exc:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(exc)
+            continue
+
+        for i, (_, future) in enumerate(items):
+            # A client that disconnects cancels its future.
+            if not future.done():
+                future.set_result((labels[i], confidences[i]))
+
+@app.on_event("startup")
+def warm_up():
+    """Score a sample application before serving.
+
+    The first prediction pays for lazy initialization (Numba compilation, or
+    loading cache=True's on-disk cache; sklearn's thread pools and code
+    paths), so do it here rather than on a client's request.
+    """
+    sample = ("Male", "Yes", 1, "Graduate", "No", 5000.0, 2000.0, 150.0, 360.0, 1.0, "Urban")
+    _score_rows([sample])
+    row = _make_row(sample)
+    _batch_buf[:1] = row
+    if _encoder is not None:
+        _release_rows([row])
+    _score_batch(1)
+
+@app.on_event("startup")
+async def size_thread_pool():
+    """Size the worker thread pool to the machine.
+
+    The sync endpoints score in anyio's default thread pool. The tree kernels
+    release the GIL, so threads scale with cores, and anything beyond a couple
+    per core only adds contention. The batcher has a limiter of its own.
+    """
+    to_thread.current_default_thread_limiter().total_tokens = (os.cpu_count() or 1) * 2
+
+@app.on_event("startup")
+async def start_batcher():
+    app.state.batch_queue = asyncio.Queue()
+    # One batch is in flight at a time, so one token is all it needs.
+    app.state.batcher = asyncio.create_task(
+        _run_batcher(app.state.batch_queue, CapacityLimiter(1))
+    )
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    app.state.batcher.cancel()
 
 # Part 4: Define the request data model
 class LoanApplication(BaseModel):
@@ -65,28 +349,119 @@ class LoanApplication(BaseModel):
     Credit_History: float = Field(..., ge=0, le=1)
     Property_Area: PropertyAreaEnum
 
-    class Config:
-        use_enum_values = True
+    model_config = ConfigDict(use_enum_values=True, frozen=True)
+
+# Bounds how long one /predict_batch call can hold a worker thread.
+MAX_BATCH_APPLICATIONS = 1000
+
+class LoanBatch(BaseModel):
+    applications: list[LoanApplication] = Field(..., max_length=MAX_BATCH_APPLICATIONS)
+
+# Rows are read straight off the model's attributes in declaration order
+# rather than through data.dict(), so that order has to be the model's.
+if tuple(LoanApplication.model_fields) != FEATURES:
+    raise RuntimeError(f"LoanApplication fields must be declared in the model's column order: {FEATURES}")
+
+def _values(data):
+    """Return the application's values in FEATURES order.
+
+    Floats are rounded to cents. /predict caches on these values, so every
+    endpoint scores the rounded inputs and gives the same answer for the same
+    application.
+    """
+    return (
+        data.Gender,
+        data.Married,
+        data.Dependents,
+        data.Education,
+        data.Self_Employed,
+        round(data.ApplicantIncome, 2),
+        round(data.CoapplicantIncome, 2),
+        round(data.LoanAmount, 2),
+        round(data.Loan_Amount_Term, 2),
+        round(data.Credit_History, 2),
+        data.Property_Area,
+    )
 
 # Part 5: Create the prediction endpoint
-@app.post("/predict")
-def predict(data: LoanApplication):
-    """This is where the magic happens!"""
-    input_df = pd.DataFrame([data.dict()])
-    prediction = model.predict(input_df)
-    probability = model.predict_proba(input_df)
+# Identical applications are common (the categoricals only have 96
+# combinations and amounts cluster on round numbers), so results are memoized
+# on the input values (rounded to cents by _values). The cache holds the
+# rendered JSON body, so a hit skips serialization too. It is only touched from
+# the event loop, so it needs no lock.
+CACHE_SIZE = 4096
 
-    if prediction[0] == 1:
-        status = "Approved"
-    else:
-        status = "Not Approved"
+_cache = OrderedDict()
+_STATUS = ("Not Approved", "Approved")
 
+def _result(prediction, confidence):
+    """Build the response fields from a label and its positive-class probability."""
     return {
-        "prediction": int(prediction[0]),
-        "status": status,
-        "confidence_probability": f"{probability[0][1]:.2%}"
+        "prediction": prediction,
+        "status": _STATUS[prediction],
+        "confidence_probability": f"{confidence * 100:.2f}%"
     }
 
+def _render(content):
+    """Serialize a response body built from plain Python values."""
+    return orjson.dumps(content)
+
+@app.post("/predict", response_model=None)
+async def predict(data: LoanApplication):
+    """This is where the magic happens!"""
+    row = _values(data)
+    body = _cache.get(row)
+    if body is not None:
+        _cache.move_to_end(row)
+        cache_status = "HIT"
+    else:
+        future = asyncio.get_running_loop().create_future()
+        app.state.batch_queue.put_nowait((_make_row(row), future))
+        prediction, confidence = await future
+
+        body = _render(_result(prediction, confidence))
+        _cache[row] = body
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+        cache_status = "MISS"
+
+    return Response(body, media_type="application/json", headers={"X-Cache": cache_status})
+
+@app.post("/predict_raw", response_model=None)
+def predict_raw(features: list[float]):
+    """Score an already-encoded feature vector, for trusted internal clients.
+
+    The vector must be in the classifier's input layout (after scaling and
+    one-hot encoding), so no application validation or encoding is done.
+    """
+    if len(features) != N_ENCODED:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Expected {N_ENCODED} features, got {len(features)}",
+        )
+    row = _take_row()
+    try:
+        row[0] = features
+        predictions, probabilities = _score_encoded(row)
+    finally:
+        _release_rows([row])
+    return Response(_render(_result(predictions.item(0), probabilities.item(0, 1))), media_type="application/json")
+
+@app.post("/predict_batch", response_model=None)
+def predict_batch(data: LoanBatch):
+    """Score many applications with a single model call.
+
+    Returns one result per application, in the same order and shape as
+    /predict.
+    """
+    if not data.applications:
+        return Response(b"[]", media_type="application/json")
+    predictions, probabilities = _score_rows([_values(a) for a in data.applications])
+    return Response(_render([
+        _result(prediction, confidence)
+        for prediction, confidence in zip(predictions.tolist(), probabilities[:, 1].tolist())
+    ]), media_type="application/json")
+
 # Part 6: Create the root endpoint
 @app.get("/")
 def read_root():
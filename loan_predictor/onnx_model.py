@@ -0,0 +1,41 @@
+"""ONNX Runtime scoring for the pipeline's classifier.
+
+convert_to_onnx.py exports the fitted classifier to model.onnx. When that file
+exists and onnxruntime is installed, the API scores the encoded rows with
+ONNX Runtime's C++ tree-ensemble kernels instead of scikit-learn.
+onnxruntime is optional: when it is not installed, HAVE_ONNXRUNTIME is False.
+"""
+try:
+    import onnxruntime
+    HAVE_ONNXRUNTIME = True
+except ImportError:
+    HAVE_ONNXRUNTIME = False
+
+
+class OnnxClassifier:
+    """A classifier exported by convert_to_onnx.py, loaded into ONNX Runtime."""
+
+    def __init__(self, path):
+        self.session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+        [model_input] = self.session.get_inputs()
+        self.input_name = model_input.name
+        # skl2onnx classifiers output (label, probabilities); the label is
+        # computed the way the classifier's own predict() does it.
+        self.label_name, self.proba_name = [output.name for output in self.session.get_outputs()[:2]]
+        # Written by convert_to_onnx.py; identifies the model.joblib exported.
+        self.source_sha256 = self.session.get_modelmeta().custom_metadata_map.get("model_joblib_sha256")
+
+    def predict(self, X):
+        """Return the labels and class probabilities for the float32 rows of X.
+
+        The input is bound in place rather than copied into a feed dict. Each
+        call gets its own binding, since batches vary in size and several
+        threads score at once.
+        """
+        binding = self.session.io_binding()
+        binding.bind_cpu_input(self.input_name, X)
+        binding.bind_output(self.label_name)
+        binding.bind_output(self.proba_name)
+        self.session.run_with_iobinding(binding)
+        labels, probabilities = binding.copy_outputs_to_cpu()
+        return labels, probabilities
@@ -0,0 +1,81 @@
+"""Check the lookup-table encoder in encoding.py against the fitted transformer.
+
+Run from this directory with: python -m pytest
+"""
+import os
+from itertools import product
+
+import numpy as np
+import pytest
+
+joblib = pytest.importorskip("joblib")
+pd = pytest.importorskip("pandas")
+pytest.importorskip("sklearn")
+
+from sklearn.compose import ColumnTransformer
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from encoding import compile_encoder
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model.joblib")
+
+
+@pytest.fixture(scope="module")
+def model():
+    return joblib.load(MODEL_PATH)
+
+
+def _encode(encoder, raw):
+    encoded = np.empty((len(raw), encoder.n_features))
+    for values, out in zip(raw.itertuples(index=False), encoded):
+        encoder.encode(tuple(values), out)
+    return encoded
+
+
+def test_matches_transform(model):
+    """Every category combination, each with a few sets of numeric values."""
+    preprocessor = model.steps[0][1]
+    features = list(model.feature_names_in_)
+    encoder = compile_encoder([preprocessor], features)
+    assert encoder is not None
+    assert encoder.n_features == model.steps[-1][1].n_features_in_
+
+    onehot = preprocessor.named_transformers_["cat"]
+    columns = list(preprocessor.transformers_[1][2])
+    combinations = [dict(zip(columns, values)) for values in product(*onehot.categories_)]
+    rng = np.random.default_rng(0)
+    raw = pd.DataFrame(combinations * 3)
+    raw["Dependents"] = rng.integers(0, 4, len(raw))
+    raw["ApplicantIncome"] = rng.uniform(0, 20000, len(raw)).round(2)
+    raw["CoapplicantIncome"] = rng.uniform(0, 10000, len(raw)).round(2)
+    raw["LoanAmount"] = rng.uniform(10, 700, len(raw)).round(2)
+    raw["Loan_Amount_Term"] = rng.choice([120.0, 180.0, 360.0, 480.0], len(raw))
+    raw["Credit_History"] = rng.choice([0.0, 1.0], len(raw))
+    raw = raw[features]
+
+    np.testing.assert_allclose(_encode(encoder, raw), preprocessor.transform(raw))
+
+
+def _fitted(**kwargs):
+    raw = pd.DataFrame({"x": [1.0, 2.0, 3.0], "c": ["a", "b", "a"]})
+    onehot = OneHotEncoder(handle_unknown=kwargs.pop("handle_unknown", "ignore"))
+    preprocessor = ColumnTransformer(
+        [("num", StandardScaler(), ["x"]), ("cat", onehot, ["c"])], **kwargs
+    )
+    return preprocessor.fit(raw), raw
+
+
+def test_unknown_category_is_all_zeros():
+    preprocessor, raw = _fitted()
+    encoder = compile_encoder([preprocessor], raw.columns)
+    unknown = pd.DataFrame({"x": [2.0], "c": ["z"]})
+    np.testing.assert_allclose(_encode(encoder, unknown), preprocessor.transform(unknown))
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"transformer_weights": {"num": 2.0}},
+    {"handle_unknown": "error"},
+])
+def test_unsupported_transforms(kwargs):
+    preprocessor, raw = _fitted(**kwargs)
+    assert compile_encoder([preprocessor], raw.columns) is None
@@ -0,0 +1,69 @@
+"""Check the scoring kernels in forest.py against the classifier itself.
+
+Run from this directory with: python -m pytest
+"""
+import os
+from itertools import product
+
+import numpy as np
+import pytest
+
+joblib = pytest.importorskip("joblib")
+pd = pytest.importorskip("pandas")
+pytest.importorskip("sklearn")
+
+from forest import HAVE_NUMBA, flatten_forest, forest_proba, specialize_forest, trees_proba
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model.joblib")
+
+requires_numba = pytest.mark.skipif(not HAVE_NUMBA, reason="Numba is not installed")
+
+
+@pytest.fixture(scope="module")
+def classifier():
+    return joblib.load(MODEL_PATH).steps[-1][1]
+
+
+@pytest.fixture(scope="module")
+def rows():
+    """Encoded rows covering every category combination, some with NaNs."""
+    model = joblib.load(MODEL_PATH)
+    preprocessor = model.steps[0][1]
+    onehot = preprocessor.named_transformers_["cat"]
+    columns = list(preprocessor.transformers_[1][2])
+    rng = np.random.default_rng(0)
+    raw = pd.DataFrame(
+        [dict(zip(columns, values)) for values in product(*onehot.categories_)]
+    )
+    raw["Dependents"] = rng.integers(0, 4, len(raw))
+    raw["ApplicantIncome"] = rng.uniform(0, 20000, len(raw)).round(2)
+    raw["CoapplicantIncome"] = rng.uniform(0, 10000, len(raw)).round(2)
+    raw["LoanAmount"] = rng.uniform(10, 700, len(raw)).round(2)
+    raw["Loan_Amount_Term"] = rng.choice([120.0, 180.0, 360.0, 480.0], len(raw))
+    raw["Credit_History"] = rng.choice([0.0, 1.0], len(raw))
+    X = preprocessor.transform(raw[list(model.feature_names_in_)]).astype(np.float32)
+
+    # Every feature missing in turn, plus a row with nothing but NaNs.
+    missing = np.repeat(X[:1], X.shape[1] + 1, axis=0)
+    for j in range(X.shape[1]):
+        missing[j, j] = np.nan
+    missing[-1] = np.nan
+    return np.ascontiguousarray(np.concatenate([X, missing]))
+
+
+def test_trees_proba(classifier, rows):
+    np.testing.assert_allclose(trees_proba(rows, classifier), classifier.predict_proba(rows))
+
+
+@requires_numba
+def test_forest_proba(classifier, rows):
+    forest = flatten_forest(classifier)
+    np.testing.assert_allclose(forest_proba(rows, forest), classifier.predict_proba(rows))
+
+
+@requires_numba
+def test_specialize_forest(classifier, rows):
+    specialized = specialize_forest(flatten_forest(classifier))
+    if specialized is None:
+        pytest.skip("the trees are too deep to write out")
+    np.testing.assert_allclose(specialized(rows), classifier.predict_proba(rows))